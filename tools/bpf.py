@@ -176,6 +176,10 @@ class BasicBlock(AbstractBlock):
         return b''.join(i.encode() for i in self._instructions)
 
     def __eq__(self, o):
+        if self is o:
+            # Compiled filters are shared between syscalls, so this avoids
+            # comparing all of their instructions.
+            return True
         if not isinstance(o, BasicBlock):
             return False
         return self._instructions == o._instructions
@@ -374,34 +378,18 @@ class AbstractVisitor(abc.ABC):
         return block
 
     def visit(self, block):
-        if isinstance(block, KillProcess):
-            self.visitKillProcess(block)
-        elif isinstance(block, KillThread):
-            self.visitKillThread(block)
-        elif isinstance(block, Trap):
-            self.visitTrap(block)
-        elif isinstance(block, ReturnErrno):
-            self.visitReturnErrno(block)
-        elif isinstance(block, Trace):
-            self.visitTrace(block)
-        elif isinstance(block, UserNotify):
-            self.visitUserNotify(block)
-        elif isinstance(block, Log):
-            self.visitLog(block)
-        elif isinstance(block, Allow):
-            self.visitAllow(block)
-        elif isinstance(block, BasicBlock):
-            self.visitBasicBlock(block)
-        elif isinstance(block, ValidateArch):
-            self.visitValidateArch(block)
-        elif isinstance(block, SyscallEntry):
-            self.visitSyscallEntry(block)
-        elif isinstance(block, WideAtom):
-            self.visitWideAtom(block)
-        elif isinstance(block, Atom):
-            self.visitAtom(block)
-        else:
-            raise Exception('Unknown block type: %r' % block)
+        # Most blocks are instances of one of the classes in the dispatch
+        # table, so try an exact type lookup first, which is a lot cheaper than
+        # going through a chain of isinstance() checks.
+        method_name = _VISITOR_METHODS.get(type(block))
+        if method_name is None:
+            for block_type, block_method_name in _VISITOR_DISPATCH_ORDER:
+                if isinstance(block, block_type):
+                    method_name = block_method_name
+                    break
+            else:
+                raise Exception('Unknown block type: %r' % block)
+        getattr(self, method_name)(block)
 
     @abc.abstractmethod
     def visitKillProcess(self, block):
@@ -456,6 +444,26 @@ class AbstractVisitor(abc.ABC):
         pass
 
 
+# The order matters for the isinstance() fallback, since all the actions are
+# also BasicBlocks.
+_VISITOR_DISPATCH_ORDER = (
+    (KillProcess, 'visitKillProcess'),
+    (KillThread, 'visitKillThread'),
+    (Trap, 'visitTrap'),
+    (ReturnErrno, 'visitReturnErrno'),
+    (Trace, 'visitTrace'),
+    (UserNotify, 'visitUserNotify'),
+    (Log, 'visitLog'),
+    (Allow, 'visitAllow'),
+    (BasicBlock, 'visitBasicBlock'),
+    (ValidateArch, 'visitValidateArch'),
+    (SyscallEntry, 'visitSyscallEntry'),
+    (WideAtom, 'visitWideAtom'),
+    (Atom, 'visitAtom'),
+)
+_VISITOR_METHODS = dict(_VISITOR_DISPATCH_ORDER)
+
+
 class CopyingVisitor(AbstractVisitor):
     """A visitor that copies Blocks."""
 
@@ -599,16 +607,22 @@ class FlatteningVisitor:
     def __init__(self, *, arch, kill_action):
         self._visited = set()
         self._kill_action = kill_action
-        self._instructions = []
+        # Blocks are visited in reverse order, so every block's instructions
+        # need to be placed in front of the ones emitted so far. Instead of
+        # prepending to a single list (which is quadratic), the instructions of
+        # each block are kept in a list of chunks that is reversed at the end.
+        self._chunks = []
+        self._length = 0
         self._arch = arch
         self._offsets = {}
 
     @property
     def result(self):
-        return BasicBlock(self._instructions)
+        return BasicBlock(
+            [ins for chunk in reversed(self._chunks) for ins in chunk])
 
     def _distance(self, block):
-        distance = self._offsets[id(block)] + len(self._instructions)
+        distance = self._offsets[id(block)] + self._length
         assert distance >= 0
         return distance
 
@@ -646,7 +660,14 @@ class FlatteningVisitor:
     def visit(self, block):
         assert id(block) not in self._offsets
 
-        if isinstance(block, BasicBlock):
+        # WideAtoms make up most of the blocks in a program with argument
+        # filters, so check for those first.
+        if isinstance(block, WideAtom):
+            instructions = (
+                self._emit_load_arg(block.arg_offset) + self._emit_jmp(
+                    block.op, block.value, self._distance(block.jt),
+                    self._distance(block.jf)))
+        elif isinstance(block, BasicBlock):
             instructions = block.instructions
         elif isinstance(block, ValidateArch):
             instructions = [
@@ -661,16 +682,12 @@ class FlatteningVisitor:
             instructions = self._emit_jmp(block.op, block.syscall_number,
                                           self._distance(block.jt),
                                           self._distance(block.jf))
-        elif isinstance(block, WideAtom):
-            instructions = (
-                self._emit_load_arg(block.arg_offset) + self._emit_jmp(
-                    block.op, block.value, self._distance(block.jt),
-                    self._distance(block.jf)))
         else:
             raise Exception('Unknown block type: %r' % block)
 
-        self._instructions = instructions + self._instructions
-        self._offsets[id(block)] = -len(self._instructions)
+        self._chunks.append(instructions)
+        self._length += len(instructions)
+        self._offsets[id(block)] = -self._length
         return
 
 
@@ -60,13 +60,31 @@ static const struct {
 #endif
 """
 
+def _optimization_strategy(value):
+    try:
+        return compiler.OptimizationStrategy.from_string(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'invalid choice: %r (choose from %s)' %
+            (value, ', '.join(
+                repr(str(strategy))
+                for strategy in compiler.OptimizationStrategy))) from None
+
+
 def parse_args(argv):
     """Return the parsed CLI arguments for this tool."""
     arg_parser = argparse.ArgumentParser(description=__doc__)
     arg_parser.add_argument('--optimization-strategy',
                             default=compiler.OptimizationStrategy.BST,
-                            type=compiler.OptimizationStrategy,
+                            type=_optimization_strategy,
                             choices=list(compiler.OptimizationStrategy))
+    arg_parser.add_argument(
+        '--hoisting-ratio',
+        type=float,
+        default=1.0,
+        help=('When using the bst optimization strategy, check syscalls whose '
+              'frequency exceeds this many times the combined frequency of all '
+              'less frequent syscalls before the tree (default: %(default)s).'))
     arg_parser.add_argument('--include-depth-limit', default=10)
     arg_parser.add_argument('--arch-json', default='constants.json')
     arg_parser.add_argument(
@@ -97,6 +115,18 @@ def parse_args(argv):
         help=('Output the compiled bpf to a constant variable in a C header '
               'file instead of a binary file (output should not have a .h '
               'extension, one will be added).'))
+    arg_parser.add_argument(
+        '--cache-dir',
+        metavar='DIR',
+        help=('Cache compiled policies in the specified directory and reuse '
+              'them on subsequent runs as long as none of the policy files '
+              'change.'))
+    arg_parser.add_argument(
+        '--cache',
+        action='store_const',
+        dest='cache_dir',
+        const=compiler.get_default_cache_dir(),
+        help='Same as --cache-dir, using %(const)s as the directory.')
     arg_parser.add_argument('policy',
                             help='The seccomp policy.',
                             type=argparse.FileType('r'))
@@ -149,7 +179,9 @@ Warning: MINJAIL_DEFAULT_RET_LOG is on, policy will not have any effect
         include_depth_limit=opts.include_depth_limit,
         override_default_action=override_default_action,
         denylist=opts.denylist,
-        ret_log=opts.use_ret_log)
+        ret_log=opts.use_ret_log,
+        cache_dir=opts.cache_dir,
+        hoisting_ratio=opts.hoisting_ratio)
     # Outputs the bpf binary to a c header file instead of a binary file.
     if opts.output_header_file:
         output_file_base = opts.output
@@ -18,7 +18,17 @@
 
 from __future__ import print_function
 
+import bisect
+import concurrent.futures
 import enum
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sys
+import tempfile
 
 try:
     import bpf
@@ -27,30 +37,45 @@ except ImportError:
     from minijail import bpf
     from minijail import parser  # pylint: disable=wrong-import-order
 
+# Used to check whether a filter statement unconditionally allows a syscall
+# without having to build a new block for every statement. Since parsed
+# actions are distinct objects, this still needs to be compared with ==.
+_ALLOW_ACTION = bpf.Allow()
 
-class OptimizationStrategy(enum.Enum):
+
+class OptimizationStrategy(enum.IntEnum):
     """The available optimization strategies."""
 
     # Generate a linear chain of syscall number checks. Works best for policies
     # with very few syscalls.
-    LINEAR = 'linear'
+    LINEAR = 1
 
     # Generate a binary search tree for the syscalls. Works best for policies
     # with a lot of syscalls, where no one syscall dominates.
-    BST = 'bst'
+    BST = 2
 
     def __str__(self):
-        return self.value
+        return self.name.lower()
+
+    @classmethod
+    def from_string(cls, value):
+        """Return the strategy whose name (as returned by str()) is |value|."""
+        try:
+            return cls[value.upper()]
+        except KeyError:
+            raise ValueError(
+                f'unknown optimization strategy {value!r}') from None
 
 
 class SyscallPolicyEntry:
     """The parsed version of a seccomp policy line."""
 
+    __slots__ = ('name', 'number', 'frequency', 'filter')
+
     def __init__(self, name, number, frequency):
         self.name = name
         self.number = number
         self.frequency = frequency
-        self.accumulated = 0
         self.filter = None
 
     def __repr__(self):
@@ -70,10 +95,11 @@ class SyscallPolicyEntry:
 class SyscallPolicyRange:
     """A contiguous range of SyscallPolicyEntries that have the same action."""
 
+    __slots__ = ('numbers', 'frequency', 'filter')
+
     def __init__(self, *entries):
         self.numbers = (entries[0].number, entries[-1].number + 1)
         self.frequency = sum(e.frequency for e in entries)
-        self.accumulated = 0
         self.filter = entries[0].filter
 
     def __repr__(self):
@@ -85,7 +111,8 @@ class SyscallPolicyRange:
         """Simulate the policy with the given arguments."""
         if not self.filter:
             return (0, 'ALLOW')
-        return self.filter.simulate(arch, syscall_number, *args)
+        return bpf.simulate(self.filter.instructions, arch, syscall_number,
+                            *args)
 
 
 def _convert_to_ranges(entries):
@@ -136,6 +163,29 @@ def _compile_single_range(entry,
                 entry.numbers[0], upper_entry, reject_action, op=bpf.BPF_JGE))
 
 
+def _single_range_cost(entry, lower_bound=0, upper_bound=1e99):
+    # Returns the number of comparisons that _compile_single_range() would
+    # emit for the entry, without actually building any blocks.
+    if entry.numbers[1] - entry.numbers[0] == 1:
+        return 1
+    if entry.numbers[0] == lower_bound or entry.numbers[1] == upper_bound:
+        return 1
+    return 2
+
+
+def _linear_ranges_cost(frequencies, comparison_costs, lo, hi):
+    # Returns the cost that _compile_ranges_linear() would compute for the
+    # ranges in the half-open interval [lo, hi), without actually building the
+    # chain of comparisons. The ranges are described by their frequencies and
+    # the number of comparisons that each one of them needs.
+    cost = 0
+    accumulated_frequencies = 0
+    for i in sorted(range(lo, hi), key=frequencies.__getitem__):
+        accumulated_frequencies += frequencies[i]
+        cost += accumulated_frequencies * comparison_costs[i]
+    return cost
+
+
 def _compile_ranges_linear(ranges, accept_action, reject_action):
     # Compiles the list of ranges into a simple linear list of comparisons. In
     # order to make the generated code a bit more efficient, we sort the
@@ -152,12 +202,108 @@ def _compile_ranges_linear(ranges, accept_action, reject_action):
     return (cost, next_action)
 
 
+def _find_midpoint(accumulated_frequencies, lo, hi):
+    # Returns the index |i| (with lo < i < hi) that splits the half-open
+    # interval [lo, hi) into two parts whose total frequencies are as close to
+    # each other as possible. |accumulated_frequencies| holds the prefix sums
+    # of the frequencies, so that accumulated_frequencies[i] is the sum of the
+    # first |i| frequencies.
+    previous_accumulated = accumulated_frequencies[lo]
+    total = accumulated_frequencies[hi] - previous_accumulated
+    # Find the first split point whose left side reaches half of the total
+    # frequency, and then choose whether to split there or right before it.
+    midpoint = bisect.bisect_left(accumulated_frequencies,
+                                  previous_accumulated + total / 2, lo + 1, hi)
+    best_midpoint = None
+    best_difference = None
+    for candidate in (midpoint - 1, midpoint):
+        if not lo < candidate < hi:
+            continue
+        left_frequency = (accumulated_frequencies[candidate] -
+                          previous_accumulated)
+        difference = abs(total - 2 * left_frequency)
+        if best_difference is None or difference < best_difference:
+            best_midpoint = candidate
+            best_difference = difference
+    return best_midpoint
+
+
+def _compile_ranges_balanced(ranges, accept_action, reject_action):
+    # Compiles the list of ranges into a binary search tree where every
+    # internal node splits the ranges so that the frequencies on either side
+    # are as even as possible. Unlike _compile_entries_bst, this does not try
+    # to find the cheapest possible tree, but it can be built in O(n log n)
+    # since the split point can be found with a binary search over the
+    # accumulated frequencies (see _find_midpoint).
+    accumulated_frequencies = [0]
+    accumulated_frequencies.extend(
+        itertools.accumulate(entry.frequency for entry in ranges))
+
+    def _generate_balanced_tree(lo, hi, lower_bound, upper_bound):
+        if hi - lo == 1:
+            entry = ranges[lo]
+            if (lower_bound, upper_bound) == entry.numbers:
+                # If bounds are tight around the syscall, it costs nothing.
+                return (0, entry.filter or accept_action)
+            result = _compile_single_range(entry, accept_action, reject_action,
+                                           lower_bound, upper_bound)
+            return (result[0] * entry.frequency, result[1])
+
+        total = accumulated_frequencies[hi] - accumulated_frequencies[lo]
+        best_midpoint = _find_midpoint(accumulated_frequencies, lo, hi)
+        cutoff_bound = ranges[best_midpoint].numbers[0]
+        left_subtree = _generate_balanced_tree(lo, best_midpoint, lower_bound,
+                                               cutoff_bound)
+        right_subtree = _generate_balanced_tree(best_midpoint, hi,
+                                                cutoff_bound, upper_bound)
+        return (total + left_subtree[0] + right_subtree[0],
+                bpf.SyscallEntry(
+                    cutoff_bound,
+                    right_subtree[1],
+                    left_subtree[1],
+                    op=bpf.BPF_JGE))
+
+    return _generate_balanced_tree(0, len(ranges), 0, 2**64 - 1)
+
+
 def _compile_entries_linear(entries, accept_action, reject_action):
-    return _compile_ranges_linear(
-        _convert_to_ranges(entries), accept_action, reject_action)[1]
+    ranges = list(_convert_to_ranges(entries))
+    linear_cost, linear_action = _compile_ranges_linear(
+        ranges, accept_action, reject_action)
+    if any(entry.filter for entry in ranges):
+        return linear_action
+    # If none of the syscalls have argument filters, it is cheap to also build
+    # a frequency-balanced tree, which avoids walking through a chain of
+    # O(n) comparisons for policies with many syscalls. Only use it if it is
+    # expected to be cheaper, which is not the case when a handful of
+    # syscalls dominate the frequencies.
+    balanced_cost, balanced_action = _compile_ranges_balanced(
+        ranges, accept_action, reject_action)
+    if balanced_cost < linear_cost:
+        return balanced_action
+    return linear_action
+
+
+def _tree_cost_lower_bound(frequencies):
+    # Returns a lower bound for the cost of any tree that _compile_ranges_bst()
+    # could build for ranges with the given frequencies. Every internal node
+    # and every comparison in a leaf costs at least the frequency of all the
+    # ranges below it, so the cost is never lower than the weighted path
+    # length of the optimal (Huffman) binary tree with the ranges as leaves.
+    heap = list(frequencies)
+    heapq.heapify(heap)
+    cost = 0
+    while len(heap) > 1:
+        merged = heapq.heappop(heap) + heapq.heappop(heap)
+        cost += merged
+        heapq.heappush(heap, merged)
+    return cost
 
 
-def _compile_entries_bst(entries, accept_action, reject_action):
+def _compile_ranges_bst(ranges,
+                        accept_action,
+                        reject_action,
+                        memoized_costs=None):
     # Instead of generating a linear list of comparisons, this method generates
     # a binary search tree, where some of the leaves can be linear chains of
     # comparisons.
@@ -186,74 +332,251 @@ def _compile_entries_bst(entries, accept_action, reject_action):
     # not be unimodal / convex. This unfortunately means that more clever
     # techniques like using ternary search (which would reduce the overall
     # complexity to O(n^2 log n)) do not work in all cases.
-    ranges = list(_convert_to_ranges(entries))
-
-    accumulated = 0
-    for entry in ranges:
-        accumulated += entry.frequency
-        entry.accumulated = accumulated
+    #
+    # The fields of the ranges that are read in the innermost loop are copied
+    # into parallel lists, which avoids going through the attributes of the
+    # range objects every time.
+    lower_numbers = [entry.numbers[0] for entry in ranges]
+    upper_numbers = [entry.numbers[1] for entry in ranges]
+    frequencies = [entry.frequency for entry in ranges]
+    # The prefix sums start with a 0, so that the total frequency of the ranges
+    # in [lo, hi) is accumulated_frequencies[hi] - accumulated_frequencies[lo].
+    accumulated_frequencies = [0]
+    accumulated_frequencies.extend(itertools.accumulate(frequencies))
+    linear_comparison_costs = [_single_range_cost(entry) for entry in ranges]
 
     # Memoization cache to build the DP table top-down, which is easier to
-    # understand.
-    memoized_costs = {}
-
-    def _generate_syscall_bst(ranges, indices, bounds=(0, 2**64 - 1)):
-        assert bounds[0] <= ranges[indices[0]].numbers[0], (indices, bounds)
-        assert ranges[indices[1] - 1].numbers[1] <= bounds[1], (indices,
-                                                                bounds)
-
+    # understand. The subtrees are identified by their bounds, so the caller
+    # can provide subtrees that were already computed for the same ranges in a
+    # previous call, as long as the ranges within those bounds did not change.
+    if memoized_costs is None:
+        memoized_costs = {}
+
+    def _generate_syscall_bst(lo, hi, lower_bound=0, upper_bound=2**64 - 1):
+        # Considers the ranges in the half-open interval [lo, hi), all of
+        # which need to be contained within [lower_bound, upper_bound).
+        assert lower_bound <= lower_numbers[lo], (lo, hi, lower_bound)
+        assert upper_numbers[hi - 1] <= upper_bound, (lo, hi, upper_bound)
+
+        bounds = (lower_bound, upper_bound)
         if bounds in memoized_costs:
             return memoized_costs[bounds]
-        if indices[1] - indices[0] == 1:
-            if bounds == ranges[indices[0]].numbers:
+        if hi - lo == 1:
+            if bounds == ranges[lo].numbers:
                 # If bounds are tight around the syscall, it costs nothing.
-                memoized_costs[bounds] = (0, ranges[indices[0]].filter
+                memoized_costs[bounds] = (0, ranges[lo].filter
                                           or accept_action)
                 return memoized_costs[bounds]
-            result = _compile_single_range(ranges[indices[0]], accept_action,
+            result = _compile_single_range(ranges[lo], accept_action,
                                            reject_action)
-            memoized_costs[bounds] = (result[0] * ranges[indices[0]].frequency,
-                                      result[1])
+            memoized_costs[bounds] = (result[0] * frequencies[lo], result[1])
             return memoized_costs[bounds]
 
         # Try the linear model first and use that as the best estimate so far.
-        best_cost = _compile_ranges_linear(ranges[slice(*indices)],
-                                           accept_action, reject_action)
+        # Building the chain is only done if it ends up being the cheapest
+        # option, since most of the time some partition will beat it.
+        best_cost = _linear_ranges_cost(frequencies, linear_comparison_costs,
+                                        lo, hi)
+        best_partition = None
 
         # Now recursively go through all possible partitions of the interval
-        # currently being considered.
-        previous_accumulated = ranges[indices[0]].accumulated - ranges[
-            indices[0]].frequency
+        # currently being considered. Only the cost and the subtrees of the
+        # best partition are tracked, so that the SyscallEntry for the
+        # internal node is built only once.
         bst_comparison_cost = (
-            ranges[indices[1] - 1].accumulated - previous_accumulated)
-        for i, entry in enumerate(ranges[slice(*indices)]):
-            candidates = [entry.numbers[0]]
-            if i:
-                candidates.append(ranges[i - 1 + indices[0]].numbers[1])
-            for cutoff_bound in candidates:
-                if not bounds[0] < cutoff_bound < bounds[1]:
+            accumulated_frequencies[hi] - accumulated_frequencies[lo])
+        for i in range(lo + 1, hi):
+            for cutoff_bound in (lower_numbers[i], upper_numbers[i - 1]):
+                if not lower_bound < cutoff_bound < upper_bound:
                     continue
-                if not indices[0] < i + indices[0] < indices[1]:
-                    continue
-                left_subtree = _generate_syscall_bst(
-                    ranges, (indices[0], i + indices[0]),
-                    (bounds[0], cutoff_bound))
-                right_subtree = _generate_syscall_bst(
-                    ranges, (i + indices[0], indices[1]),
-                    (cutoff_bound, bounds[1]))
-                best_cost = min(
-                    best_cost,
-                    (bst_comparison_cost + left_subtree[0] + right_subtree[0],
-                     bpf.SyscallEntry(
-                         cutoff_bound,
-                         right_subtree[1],
-                         left_subtree[1],
-                         op=bpf.BPF_JGE)))
-
-        memoized_costs[bounds] = best_cost
+                # Most of the subtrees have already been computed, so look
+                # them up directly to avoid the overhead of a function call.
+                left_subtree = memoized_costs.get((lower_bound, cutoff_bound))
+                if left_subtree is None:
+                    left_subtree = _generate_syscall_bst(
+                        lo, i, lower_bound, cutoff_bound)
+                right_subtree = memoized_costs.get((cutoff_bound, upper_bound))
+                if right_subtree is None:
+                    right_subtree = _generate_syscall_bst(
+                        i, hi, cutoff_bound, upper_bound)
+                cost = (bst_comparison_cost + left_subtree[0] +
+                        right_subtree[0])
+                if cost < best_cost:
+                    best_cost = cost
+                    best_partition = (cutoff_bound, left_subtree[1],
+                                      right_subtree[1])
+
+        if best_partition is None:
+            memoized_costs[bounds] = _compile_ranges_linear(
+                ranges[lo:hi], accept_action, reject_action)
+        else:
+            cutoff_bound, left_action, right_action = best_partition
+            memoized_costs[bounds] = (best_cost,
+                                      bpf.SyscallEntry(
+                                          cutoff_bound,
+                                          right_action,
+                                          left_action,
+                                          op=bpf.BPF_JGE))
         return memoized_costs[bounds]
 
-    return _generate_syscall_bst(ranges, (0, len(ranges)))[1]
+    return _generate_syscall_bst(0, len(ranges))
+
+
+def _compile_entries_bst(entries,
+                         accept_action,
+                         reject_action,
+                         *,
+                         hoisting_ratio=1.0):
+    ranges = list(_convert_to_ranges(entries))
+    memoized_costs = {}
+    best_cost, best_action = _compile_ranges_bst(ranges, accept_action,
+                                                 reject_action, memoized_costs)
+
+    # Any syscall whose frequency exceeds the sum of the frequencies of all the
+    # syscalls that are less frequent than it (scaled by |hoisting_ratio|) is
+    # cheaper to check in a linear chain in front of the tree, since that saves
+    # it from traversing any of the internal nodes. Raising |hoisting_ratio|
+    # makes it less likely for syscalls to be hoisted.
+    hoisted_indices = []
+    remaining_frequency = sum(entry.frequency for entry in ranges)
+    for i in sorted(range(len(ranges)), key=lambda i: -ranges[i].frequency):
+        less_frequent = remaining_frequency - ranges[i].frequency
+        if not less_frequent:
+            # Keep at least one of the ranges in the tree.
+            break
+        if ranges[i].frequency <= hoisting_ratio * less_frequent:
+            break
+        remaining_frequency = less_frequent
+        hoisted_indices.append(i)
+    if not hoisted_indices:
+        return best_action
+
+    # Everything that is not caught by the hoisted syscalls also needs to pay
+    # for all of their comparisons.
+    chain_cost = 0
+    accumulated_frequencies = remaining_frequency
+    for i in hoisted_indices[::-1]:
+        accumulated_frequencies += ranges[i].frequency
+        chain_cost += accumulated_frequencies * _single_range_cost(ranges[i])
+    remaining_ranges = [
+        entry for i, entry in enumerate(ranges) if i not in hoisted_indices
+    ]
+    # Building the tree for the remaining ranges is as expensive as building
+    # the original one, so avoid it if the hoisted chain cannot possibly win.
+    if chain_cost + _tree_cost_lower_bound(
+            entry.frequency for entry in remaining_ranges) >= best_cost:
+        return best_action
+
+    # The subtrees whose bounds do not contain any of the hoisted ranges have
+    # exactly the same ranges without them, so they can be reused.
+    hoisted_numbers = [ranges[i].numbers for i in hoisted_indices]
+    reusable_costs = {
+        bounds: subtree
+        for bounds, subtree in memoized_costs.items()
+        if not any(bounds[0] < upper and lower < bounds[1]
+                   for lower, upper in hoisted_numbers)
+    }
+    hoisted_cost, next_action = _compile_ranges_bst(
+        remaining_ranges, accept_action, reject_action, reusable_costs)
+    if chain_cost + hoisted_cost >= best_cost:
+        return best_action
+    for i in hoisted_indices[::-1]:
+        next_action = _compile_single_range(ranges[i], accept_action,
+                                            next_action)[1]
+    return next_action
+
+
+def get_default_cache_dir():
+    """Return the default directory where compiled policies are cached."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'minijail')
+
+
+def _file_digest(filename, loader=None):
+    # Modules imported from an archive are not backed by files on disk, so
+    # their contents need to be read through their loader.
+    if loader is not None:
+        return hashlib.sha256(loader.get_data(filename)).hexdigest()
+    with open(filename, 'rb') as input_file:
+        return hashlib.sha256(input_file.read()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _compiler_digest():
+    # Cached programs are only valid for the exact compiler that generated
+    # them, so the sources of the compiler itself are part of the cache key.
+    # This way any change to the generated code invalidates the cache without
+    # having to remember to bump a version number. Returns None if the sources
+    # cannot be read, in which case nothing is cached.
+    digest = hashlib.sha256()
+    try:
+        for module in (sys.modules[__name__], bpf, parser):
+            loader = getattr(module.__spec__, 'loader', None)
+            digest.update(
+                _file_digest(module.__file__, loader).encode('ascii'))
+    except (OSError, AttributeError, TypeError):
+        return None
+    return digest.hexdigest()
+
+
+def _load_cached_program(cache_path):
+    # Returns None if there is no usable cached program. All the files that
+    # were read when compiling the policy must be unchanged for the cached
+    # program to be usable.
+    try:
+        with open(cache_path, 'r') as cache_file:
+            cached = json.load(cache_file)
+        for filename, digest in cached['dependencies']:
+            if _file_digest(filename) != digest:
+                return None
+        return bpf.BasicBlock(
+            [bpf.SockFilter(*ins) for ins in cached['instructions']])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _store_cached_program(cache_path, program, dependency_digests):
+    # Failing to write the cache is not fatal, the program was already
+    # compiled. |dependency_digests| are the digests of the contents of the
+    # files at the time they were parsed, since they might have been modified
+    # after that.
+    try:
+        cached = {
+            'dependencies': list(
+                dict.fromkeys((os.path.abspath(filename), digest)
+                              for filename, digest in dependency_digests)),
+            'instructions': program.instructions,
+        }
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write to a temporary file first so that concurrent compilations
+        # never observe a partially-written cache entry.
+        with tempfile.NamedTemporaryFile(
+                'w', dir=os.path.dirname(cache_path), delete=False) as outf:
+            json.dump(cached, outf)
+        os.replace(outf.name, cache_path)
+    except OSError:
+        pass
+
+
+def _filter_cache_key(filter_statement, kill_action):
+    # BasicBlocks are not hashable, so actions are identified by their
+    # instructions. Atoms are namedtuples, so the expressions only need to be
+    # converted into tuples.
+    return (tuple(kill_action.instructions),
+            tuple((tuple(tuple(conjunction) for conjunction in filt.expression)
+                   if filt.expression is not None else None,
+                   tuple(filt.action.instructions))
+                  for filt in filter_statement.filters))
+
+
+def _compile_filter_statement_in_worker(arch, filter_statement, *, kill_action,
+                                       denylist):
+    # Entry point for worker processes when compiling in parallel. This is a
+    # module-level function so that it can be pickled without also having to
+    # pickle the PolicyCompiler that started the compilation.
+    return PolicyCompiler(arch).compile_filter_statement(
+        filter_statement, kill_action=kill_action, denylist=denylist)
 
 
 class PolicyCompiler:
@@ -261,6 +584,14 @@ class PolicyCompiler:
 
     def __init__(self, arch):
         self._arch = arch
+        # Many policies apply the exact same filter to several syscalls, so
+        # the flattened filters are reused across statements. Sharing the same
+        # block also means that it is only emitted once in the final program.
+        self._filter_cache = {}
+        # Policies for different binaries tend to include the same common
+        # policy files, so their contents are kept around across calls to
+        # compile_file().
+        self._file_cache = parser.FileCache()
 
     def compile_file(self,
                      policy_filename,
@@ -270,16 +601,63 @@ class PolicyCompiler:
                      include_depth_limit=10,
                      override_default_action=None,
                      denylist=False,
-                     ret_log=False):
-        """Return a compiled BPF program from the provided policy file."""
+                     ret_log=False,
+                     cache_dir=None,
+                     parallel=False,
+                     hoisting_ratio=1.0):
+        """Return a compiled BPF program from the provided policy file.
+
+        If |cache_dir| is provided, compiled programs are cached in that
+        directory and reused as long as none of the files that the policy
+        depends on have changed. Nothing is cached if the sources of the
+        compiler itself cannot be read.
+
+        If |parallel| is True, the argument filters are compiled in a pool of
+        worker processes. The resulting program is the same.
+
+        When using the BST optimization strategy, syscalls that are more
+        frequent than |hoisting_ratio| times the sum of the frequencies of all
+        the less frequent syscalls are considered for being checked before the
+        tree.
+        """
+        compiler_digest = (_compiler_digest()
+                           if cache_dir is not None else None)
+        if compiler_digest is not None:
+            cache_key = json.dumps([
+                compiler_digest,
+                os.path.abspath(policy_filename),
+                self._arch,
+                str(optimization_strategy),
+                kill_action.instructions,
+                include_depth_limit,
+                override_default_action.instructions
+                if override_default_action else None,
+                denylist,
+                ret_log,
+                hoisting_ratio,
+            ], sort_keys=True)
+            cache_path = os.path.join(
+                cache_dir,
+                hashlib.sha256(cache_key.encode('utf-8')).hexdigest() +
+                '.json')
+            program = _load_cached_program(cache_path)
+            if program is not None:
+                return program
+
         policy_parser = parser.PolicyParser(
             self._arch,
             kill_action=kill_action,
             include_depth_limit=include_depth_limit,
             override_default_action=override_default_action,
             denylist=denylist,
-            ret_log=ret_log)
+            ret_log=ret_log,
+            file_cache=self._file_cache)
         parsed_policy = policy_parser.parse_file(policy_filename)
+        if parallel:
+            self._compile_filters_in_parallel(
+                parsed_policy.filter_statements,
+                kill_action=kill_action,
+                denylist=denylist)
         entries = [
             self.compile_filter_statement(
                 filter_statement, kill_action=kill_action, denylist=denylist)
@@ -296,8 +674,11 @@ class PolicyCompiler:
             reject_action = parsed_policy.default_action
         if entries:
             if optimization_strategy == OptimizationStrategy.BST:
-                next_action = _compile_entries_bst(entries, accept_action,
-                                                   reject_action)
+                next_action = _compile_entries_bst(
+                    entries,
+                    accept_action,
+                    reject_action,
+                    hoisting_ratio=hoisting_ratio)
             else:
                 next_action = _compile_entries_linear(entries, accept_action,
                                                       reject_action)
@@ -308,7 +689,42 @@ class PolicyCompiler:
         else:
             reject_action.accept(visitor)
             bpf.ValidateArch(reject_action).accept(visitor)
-        return visitor.result
+        program = visitor.result
+        if compiler_digest is not None:
+            _store_cached_program(cache_path, program,
+                                  policy_parser.dependency_digests)
+        return program
+
+    def _compile_filters_in_parallel(self, filter_statements, *, kill_action,
+                                     denylist):
+        # Compiles all the distinct filters that are not in the filter cache yet
+        # in worker processes and adds them to the cache, so that compiling the
+        # filter statements afterwards only needs to look them up.
+        pending_statements = {}
+        for filter_statement in filter_statements:
+            if (not denylist and
+                    filter_statement.filters[-1].action == _ALLOW_ACTION):
+                continue
+            cache_key = _filter_cache_key(filter_statement, kill_action)
+            if cache_key not in self._filter_cache:
+                pending_statements.setdefault(cache_key, filter_statement)
+        if len(pending_statements) < 2:
+            return
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            # Sending the statements in chunks amortizes the cost of pickling
+            # the arch for each task.
+            chunksize = max(1, len(pending_statements) //
+                            (4 * (os.cpu_count() or 1)))
+            compiled_entries = executor.map(
+                functools.partial(_compile_filter_statement_in_worker,
+                                  self._arch,
+                                  kill_action=kill_action,
+                                  denylist=denylist),
+                pending_statements.values(),
+                chunksize=chunksize)
+            for cache_key, policy_entry in zip(pending_statements,
+                                               compiled_entries):
+                self._filter_cache[cache_key] = policy_entry.filter
 
     def compile_filter_statement(self,
                                  filter_statement,
@@ -324,7 +740,11 @@ class PolicyCompiler:
         # false action taken here is the one that applies if the whole
         # expression fails to match.
         false_action = filter_statement.filters[-1].action
-        if not denylist and false_action == bpf.Allow():
+        if not denylist and false_action == _ALLOW_ACTION:
+            return policy_entry
+        cache_key = _filter_cache_key(filter_statement, kill_action)
+        if cache_key in self._filter_cache:
+            policy_entry.filter = self._filter_cache[cache_key]
             return policy_entry
         # We then traverse the list of filters backwards since we want
         # the root of the DAG to be the very first boolean operation in
@@ -352,4 +772,5 @@ class PolicyCompiler:
             arch=self._arch, kill_action=kill_action)
         policy_filter.accept(flattening_visitor)
         policy_entry.filter = flattening_visitor.result
+        self._filter_cache[cache_key] = policy_entry.filter
         return policy_entry
@@ -23,6 +23,7 @@ import random
 import shutil
 import tempfile
 import unittest
+from unittest import mock
 
 import arch
 import bpf
@@ -34,6 +35,20 @@ ARCH_64 = arch.Arch.load_from_json(
         os.path.dirname(os.path.abspath(__file__)), 'testdata/arch_64.json'))
 
 
+class OptimizationStrategyTests(unittest.TestCase):
+    """Tests for OptimizationStrategy."""
+
+    def test_from_string(self):
+        """Ensure strategies round-trip through their string representation."""
+        for strategy in list(compiler.OptimizationStrategy):
+            self.assertIs(
+                compiler.OptimizationStrategy.from_string(str(strategy)),
+                strategy)
+        self.assertEqual(str(compiler.OptimizationStrategy.BST), 'bst')
+        with self.assertRaises(ValueError):
+            compiler.OptimizationStrategy.from_string('quadratic')
+
+
 class CompileFilterStatementTests(unittest.TestCase):
     """Tests for PolicyCompiler.compile_filter_statement."""
 
@@ -285,6 +300,19 @@ class CompileFilterStatementTests(unittest.TestCase):
             block.simulate(self.arch.arch_nr, self.arch.syscalls['read'],
                            0)[1], 'LOG')
 
+    def test_identical_filters_are_shared(self):
+        """Reuse the compiled filter for identical filter expressions."""
+        block = self._compile('read: arg0 == 0x100 || arg1 & 0x3')
+        other_block = self._compile('read: arg0 == 0x100 || arg1 & 0x3')
+        self.assertIs(block.filter, other_block.filter)
+
+        different_block = self._compile('read: arg0 == 0x101 || arg1 & 0x3')
+        self.assertIsNot(block.filter, different_block.filter)
+        self.assertEqual(
+            different_block.simulate(self.arch.arch_nr,
+                                     self.arch.syscalls['read'], 0x101)[1],
+            'ALLOW')
+
     def test_mmap_write_xor_exec(self):
         """Accept the idiomatic filter for mmap."""
         block = self._compile(
@@ -304,6 +332,123 @@ class CompileFilterStatementTests(unittest.TestCase):
                     'ALLOW')
 
 
+class CompileRangesTests(unittest.TestCase):
+    """Tests for the syscall range helpers."""
+
+    def test_convert_to_ranges(self):
+        """Ensure contiguous syscalls with the same action are merged."""
+        shared_filter = bpf.BasicBlock([
+            bpf.SockFilter(bpf.BPF_RET, 0, 0, bpf.SECCOMP_RET_TRAP),
+        ])
+        entries = [
+            compiler.SyscallPolicyEntry('syscall%d' % number, number, 1)
+            for number in (5, 0, 1, 2, 3, 7, 8)
+        ]
+        for entry in entries:
+            if entry.number in (2, 3):
+                entry.filter = shared_filter
+
+        ranges = list(compiler._convert_to_ranges(entries))
+        self.assertEqual([r.numbers for r in ranges], [(0, 2), (2, 4),
+                                                       (5, 6), (7, 9)])
+        self.assertEqual([r.frequency for r in ranges], [2, 2, 1, 2])
+        self.assertIs(ranges[1].filter, shared_filter)
+        self.assertEqual(ranges[0].simulate(ARCH_64.arch_nr, 0)[1], 'ALLOW')
+        self.assertEqual(ranges[1].simulate(ARCH_64.arch_nr, 2)[1], 'TRAP')
+
+    def test_linear_ranges_cost(self):
+        """Ensure the linear cost estimate matches the generated chain."""
+        entries = []
+        for number in (0, 1, 2, 5, 7, 8, 20):
+            entry = compiler.SyscallPolicyEntry(
+                'syscall%d' % number, number, random.randint(1, 1024))
+            if number % 2:
+                entry.filter = bpf.BasicBlock([
+                    bpf.SockFilter(bpf.BPF_RET, 0, 0, number),
+                ])
+            entries.append(entry)
+        ranges = list(compiler._convert_to_ranges(entries))
+
+        self.assertEqual(
+            compiler._linear_ranges_cost(
+                [r.frequency for r in ranges],
+                [compiler._single_range_cost(r) for r in ranges], 0,
+                len(ranges)),
+            compiler._compile_ranges_linear(ranges, bpf.Allow(),
+                                            bpf.KillProcess())[0])
+
+    def test_find_midpoint(self):
+        """Ensure the split point balances the frequencies on either side."""
+        #           frequencies:    1, 1, 1, 10, 1, 1, 5
+        accumulated_frequencies = [0, 1, 2, 3, 13, 14, 15, 20]
+        self.assertEqual(
+            compiler._find_midpoint(accumulated_frequencies, 0, 7), 4)
+        self.assertEqual(
+            compiler._find_midpoint(accumulated_frequencies, 0, 3), 1)
+        self.assertEqual(
+            compiler._find_midpoint(accumulated_frequencies, 4, 7), 6)
+        # Even with a dominant first or last entry, both sides of the split
+        # are non-empty.
+        self.assertEqual(
+            compiler._find_midpoint(accumulated_frequencies, 3, 5), 4)
+        self.assertEqual(
+            compiler._find_midpoint(accumulated_frequencies, 2, 4), 3)
+
+    def test_bst_hoisting(self):
+        """Ensure dominant syscalls are checked before the tree."""
+        syscalls = sorted(ARCH_64.syscalls.items(),
+                          key=lambda item: item[1])[:60:2]
+        hot_name, hot_number = syscalls[10]
+
+        def _simulated_cost(**kwargs):
+            entries = [
+                compiler.SyscallPolicyEntry(
+                    name, number,
+                    1000 if name == hot_name else 1 + number % 7)
+                for name, number in syscalls
+            ]
+            visitor = bpf.FlatteningVisitor(
+                arch=ARCH_64, kill_action=bpf.KillProcess())
+            action = compiler._compile_entries_bst(entries, bpf.Allow(),
+                                                   bpf.KillProcess(),
+                                                   **kwargs)
+            action.accept(visitor)
+            bpf.ValidateArch(action).accept(visitor)
+            program = visitor.result.instructions
+            for entry in entries:
+                self.assertEqual(
+                    bpf.simulate(program, ARCH_64.arch_nr, entry.number)[1],
+                    'ALLOW')
+            return (bpf.simulate(program, ARCH_64.arch_nr, hot_number)[0],
+                    sum(entry.frequency *
+                        bpf.simulate(program, ARCH_64.arch_nr, entry.number)[0]
+                        for entry in entries))
+
+        hot_cost, total_cost = _simulated_cost()
+        # Validating the arch, a single comparison and returning.
+        self.assertEqual(hot_cost, 3 + 1 + 1)
+        self.assertLess(total_cost,
+                        _simulated_cost(hoisting_ratio=float('inf'))[1])
+
+    def test_bst_lower_bound(self):
+        """Ensure the estimated tree cost is never higher than the actual one."""
+        rng = random.Random(0)
+        syscalls = sorted(ARCH_64.syscalls.values())
+        for _ in range(20):
+            ranges = list(
+                compiler._convert_to_ranges([
+                    compiler.SyscallPolicyEntry(str(number), number,
+                                                rng.randint(1, 100))
+                    for number in sorted(
+                        rng.sample(syscalls, rng.randint(1, 30)))
+                ]))
+            self.assertLessEqual(
+                compiler._tree_cost_lower_bound(
+                    entry.frequency for entry in ranges),
+                compiler._compile_ranges_bst(ranges, bpf.Allow(),
+                                             bpf.KillProcess())[0])
+
+
 class CompileFileTests(unittest.TestCase):
     """Tests for PolicyCompiler.compile_file."""
 
@@ -379,6 +524,218 @@ class CompileFileTests(unittest.TestCase):
                 bpf.simulate(program.instructions, self.arch.arch_nr,
                              self.arch.syscalls['close'], 0)[1], 'ALLOW')
 
+    def test_compile_linear_balanced(self):
+        """Ensure unfiltered policies don't need a long chain of comparisons."""
+        syscalls = sorted(self.arch.syscalls.items(),
+                          key=lambda item: item[1])[::2][:64]
+        path = self._write_file(
+            'test.policy', '\n'.join(f'{name}: 1' for name, _ in syscalls))
+
+        program = self.compiler.compile_file(
+            path,
+            optimization_strategy=compiler.OptimizationStrategy.LINEAR,
+            kill_action=bpf.KillProcess())
+        for name, number in syscalls:
+            cost, action = bpf.simulate(program.instructions,
+                                        self.arch.arch_nr, number, 0)
+            self.assertEqual(action, 'ALLOW', name)
+            # A balanced tree of 64 syscalls needs 6 comparisons plus the
+            # final check, on top of the 3 instructions needed to validate
+            # the architecture and one to return.
+            self.assertLessEqual(cost, 3 + 6 + 1 + 1, name)
+
+    def test_compile_ranges(self):
+        """Ensure contiguous syscalls are checked with a single range."""
+        path = self._write_file(
+            'test.policy', """
+            read: allow
+            write: allow
+            open: allow
+            close: allow
+        """)
+
+        for strategy in list(compiler.OptimizationStrategy):
+            program = self.compiler.compile_file(
+                path,
+                optimization_strategy=strategy,
+                kill_action=bpf.KillProcess())
+            # Validating the arch, a single comparison against the upper end
+            # of the range, and the two actions.
+            self.assertEqual(len(program.instructions), 4 + 1 + 2)
+            for name in ('read', 'write', 'open', 'close'):
+                self.assertEqual(
+                    bpf.simulate(program.instructions, self.arch.arch_nr,
+                                 self.arch.syscalls[name], 0)[1], 'ALLOW')
+            self.assertEqual(
+                bpf.simulate(program.instructions, self.arch.arch_nr,
+                             self.arch.syscalls['syscall_4'], 0)[1],
+                'KILL_PROCESS')
+
+    def test_compile_shared_filters(self):
+        """Ensure identical filters are only emitted once."""
+        path = self._write_file(
+            'test.policy', """
+            read: arg0 == 0x100
+            write: arg0 == 0x101
+            close: arg0 == 0x100
+        """)
+
+        program = self.compiler.compile_file(
+            path,
+            optimization_strategy=compiler.OptimizationStrategy.LINEAR,
+            kill_action=bpf.KillProcess())
+        # Loading the arch and syscall number, plus two distinct filters with
+        # two loads each.
+        self.assertEqual(
+            sum(ins.code == bpf.BPF_LD | bpf.BPF_W | bpf.BPF_ABS
+                for ins in program.instructions), 2 + 2 * 2)
+        for name in ('read', 'close'):
+            self.assertEqual(
+                bpf.simulate(program.instructions, self.arch.arch_nr,
+                             self.arch.syscalls[name], 0x100)[1], 'ALLOW')
+            self.assertEqual(
+                bpf.simulate(program.instructions, self.arch.arch_nr,
+                             self.arch.syscalls[name], 0x101)[1],
+                'KILL_PROCESS')
+        self.assertEqual(
+            bpf.simulate(program.instructions, self.arch.arch_nr,
+                         self.arch.syscalls['write'], 0x101)[1], 'ALLOW')
+
+    def test_compile_cache(self):
+        """Ensure cached programs are reused until a dependency changes."""
+        cache_dir = os.path.join(self.tempdir, 'cache')
+        self._write_file('test.include.policy', 'read: allow')
+        path = self._write_file(
+            'test.policy', """
+            @include ./test.include.policy
+            close: allow
+        """)
+
+        program = self.compiler.compile_file(
+            path,
+            optimization_strategy=compiler.OptimizationStrategy.BST,
+            kill_action=bpf.KillProcess(),
+            cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # Parsing the policy again would mean that the cache was missed.
+        with mock.patch.object(parser.PolicyParser,
+                               'parse_file',
+                               side_effect=AssertionError('cache miss')):
+            cached_program = compiler.PolicyCompiler(self.arch).compile_file(
+                path,
+                optimization_strategy=compiler.OptimizationStrategy.BST,
+                kill_action=bpf.KillProcess(),
+                cache_dir=cache_dir)
+        self.assertEqual(program.instructions, cached_program.instructions)
+
+        # Changing any of the included files invalidates the cached program.
+        self._write_file('test.include.policy', 'write: allow')
+        program = self.compiler.compile_file(
+            path,
+            optimization_strategy=compiler.OptimizationStrategy.BST,
+            kill_action=bpf.KillProcess(),
+            cache_dir=cache_dir)
+        self.assertEqual(
+            bpf.simulate(program.instructions, self.arch.arch_nr,
+                         self.arch.syscalls['read'], 0)[1], 'KILL_PROCESS')
+        self.assertEqual(
+            bpf.simulate(program.instructions, self.arch.arch_nr,
+                         self.arch.syscalls['write'], 0)[1], 'ALLOW')
+
+        # Corrupt cache entries are ignored.
+        for filename in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, filename), 'w') as cache_file:
+                cache_file.write('{')
+        cached_program = self.compiler.compile_file(
+            path,
+            optimization_strategy=compiler.OptimizationStrategy.BST,
+            kill_action=bpf.KillProcess(),
+            cache_dir=cache_dir)
+        self.assertEqual(program.instructions, cached_program.instructions)
+
+    def test_compile_cache_unreadable_compiler(self):
+        """Ensure policies compile if the compiler sources cannot be read."""
+        cache_dir = os.path.join(self.tempdir, 'cache')
+        path = self._write_file('test.policy', 'read: allow')
+        compiler_sources = {
+            os.path.abspath(module.__file__)
+            for module in (compiler, bpf, parser)
+        }
+        file_digest = compiler._file_digest
+
+        def _unreadable_sources(filename, loader=None):
+            if os.path.abspath(filename) in compiler_sources:
+                raise OSError(filename)
+            return file_digest(filename, loader)
+
+        compiler._compiler_digest.cache_clear()
+        self.addCleanup(compiler._compiler_digest.cache_clear)
+        with mock.patch.object(compiler, '_file_digest', _unreadable_sources):
+            program = self.compiler.compile_file(
+                path,
+                optimization_strategy=compiler.OptimizationStrategy.BST,
+                kill_action=bpf.KillProcess(),
+                cache_dir=cache_dir)
+        self.assertEqual(
+            program.instructions,
+            compiler.PolicyCompiler(self.arch).compile_file(
+                path,
+                optimization_strategy=compiler.OptimizationStrategy.BST,
+                kill_action=bpf.KillProcess()).instructions)
+        self.assertFalse(os.path.exists(cache_dir))
+
+    def test_compile_cache_modified_while_compiling(self):
+        """Ensure files modified after being parsed invalidate the cache."""
+        cache_dir = os.path.join(self.tempdir, 'cache')
+        path = self._write_file('test.policy', 'read: allow')
+        parse_file = parser.PolicyParser.parse_file
+
+        def _parse_and_modify(policy_parser, filename):
+            parsed_policy = parse_file(policy_parser, filename)
+            self._write_file('test.policy', 'write: allow')
+            return parsed_policy
+
+        with mock.patch.object(parser.PolicyParser, 'parse_file',
+                               _parse_and_modify):
+            self.compiler.compile_file(
+                path,
+                optimization_strategy=compiler.OptimizationStrategy.BST,
+                kill_action=bpf.KillProcess(),
+                cache_dir=cache_dir)
+        program = compiler.PolicyCompiler(self.arch).compile_file(
+            path,
+            optimization_strategy=compiler.OptimizationStrategy.BST,
+            kill_action=bpf.KillProcess(),
+            cache_dir=cache_dir)
+        self.assertEqual(
+            bpf.simulate(program.instructions, self.arch.arch_nr,
+                         self.arch.syscalls['read'], 0)[1], 'KILL_PROCESS')
+        self.assertEqual(
+            bpf.simulate(program.instructions, self.arch.arch_nr,
+                         self.arch.syscalls['write'], 0)[1], 'ALLOW')
+
+    def test_compile_parallel(self):
+        """Ensure compiling in parallel generates the same program."""
+        syscalls = random.sample(list(self.arch.syscalls.keys()), 32)
+        path = self._write_file(
+            'test.policy', '\n'.join(
+                f'{name}: arg0 == {i % 8} || arg1 & {i}'
+                for i, name in enumerate(syscalls)))
+
+        for strategy in list(compiler.OptimizationStrategy):
+            program = compiler.PolicyCompiler(self.arch).compile_file(
+                path,
+                optimization_strategy=strategy,
+                kill_action=bpf.KillProcess())
+            parallel_program = compiler.PolicyCompiler(
+                self.arch).compile_file(
+                    path,
+                    optimization_strategy=strategy,
+                    kill_action=bpf.KillProcess(),
+                    parallel=True)
+            self.assertEqual(program.instructions,
+                             parallel_program.instructions)
+
     def test_compile_empty_file(self):
         """Accept empty files."""
         path = self._write_file(
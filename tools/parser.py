@@ -21,8 +21,10 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import hashlib
+import io
 import itertools
-import os.path
+import os
 import re
 
 try:
@@ -217,6 +219,43 @@ ParsedPolicy = collections.namedtuple('ParsedPolicy',
 """The result of parsing a minijail .policy file."""
 
 
+def _read_file(filename):
+    # Returns the SHA-256 digest of the contents of |filename| along with its
+    # lines. The digest is computed from the exact bytes that were parsed, so
+    # that it can be used to tell whether the file has changed since then.
+    with open(filename, 'rb') as input_file:
+        contents = input_file.read()
+    return (hashlib.sha256(contents).hexdigest(),
+            io.TextIOWrapper(io.BytesIO(contents)).readlines())
+
+
+class FileCache:
+    """A bounded cache of the contents of policy and frequency files.
+
+    Files are re-read whenever their modification time or size changes. The
+    least-recently-used files are evicted once more than |max_entries| files
+    are cached.
+    """
+
+    def __init__(self, max_entries=128):
+        self._max_entries = max_entries
+        self._entries = collections.OrderedDict()
+
+    def read_file(self, filename):
+        """Return the SHA-256 digest and the lines of |filename|."""
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != signature:
+            entry = (signature, _read_file(path))
+            self._entries[path] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(path)
+        return entry[1]
+
+
 # pylint: disable=too-few-public-methods
 class PolicyParser:
     """A parser for the Minijail seccomp policy file format."""
@@ -228,7 +267,8 @@ class PolicyParser:
                  include_depth_limit=10,
                  override_default_action=None,
                  denylist=False,
-                 ret_log=False):
+                 ret_log=False,
+                 file_cache=None):
         self._parser_states = [ParserState("<memory>")]
         self._kill_action = kill_action
         self._include_depth_limit = include_depth_limit
@@ -238,11 +278,30 @@ class PolicyParser:
         self._arch = arch
         self._denylist = denylist
         self._ret_log = ret_log
+        self._dependencies = []
+        self._file_cache = file_cache
 
     @property
     def _parser_state(self):
         return self._parser_states[-1]
 
+    def _read_lines(self, filename):
+        if self._file_cache is not None:
+            digest, lines = self._file_cache.read_file(filename)
+        else:
+            digest, lines = _read_file(filename)
+        self._dependencies.append((filename, digest))
+        return lines
+
+    @property
+    def dependency_digests(self):
+        """Return the files that were read by the last parse_file() call.
+
+        Each file is returned as a (filename, digest) pair, where the digest is
+        the SHA-256 of the contents of the file at the time it was parsed.
+        """
+        return list(self._dependencies)
+
     # single-constant = identifier
     #                 | numeric-constant
     #                 ;
@@ -661,29 +720,29 @@ class PolicyParser:
         self._parser_states.append(ParserState(filename))
         try:
             frequency_mapping = collections.defaultdict(int)
-            with open(filename) as frequency_file:
-                for tokens in self._parser_state.tokenize(frequency_file):
-                    syscall_numbers = self._parse_syscall_descriptor(tokens)
-                    if not tokens:
-                        self._parser_state.error('missing colon')
-                    if tokens[0].type != 'COLON':
-                        self._parser_state.error(
-                            'invalid colon', token=tokens[0])
-                    tokens.pop(0)
-
-                    if not tokens:
-                        self._parser_state.error('missing number')
-                    number = tokens.pop(0)
-                    if number.type != 'NUMERIC_CONSTANT':
-                        self._parser_state.error(
-                            'invalid number', token=number)
-                    number_value = int(number.value, base=0)
-                    if number_value < 0:
-                        self._parser_state.error(
-                            'invalid number', token=number)
-
-                    for syscall_number in syscall_numbers:
-                        frequency_mapping[syscall_number] += number_value
+            for tokens in self._parser_state.tokenize(
+                    self._read_lines(filename)):
+                syscall_numbers = self._parse_syscall_descriptor(tokens)
+                if not tokens:
+                    self._parser_state.error('missing colon')
+                if tokens[0].type != 'COLON':
+                    self._parser_state.error(
+                        'invalid colon', token=tokens[0])
+                tokens.pop(0)
+
+                if not tokens:
+                    self._parser_state.error('missing number')
+                number = tokens.pop(0)
+                if number.type != 'NUMERIC_CONSTANT':
+                    self._parser_state.error(
+                        'invalid number', token=number)
+                number_value = int(number.value, base=0)
+                if number_value < 0:
+                    self._parser_state.error(
+                        'invalid number', token=number)
+
+                for syscall_number in syscall_numbers:
+                    frequency_mapping[syscall_number] += number_value
             return frequency_mapping
         finally:
             self._parser_states.pop()
@@ -730,38 +789,38 @@ class PolicyParser:
         try:
             statements = []
             denylist_header = False
-            with open(filename) as policy_file:
-                for tokens in self._parser_state.tokenize(policy_file):
-                    if tokens[0].type == 'INCLUDE':
-                        statements.extend(
-                            self._parse_include_statement(tokens))
-                    elif tokens[0].type == 'FREQUENCY':
-                        for syscall_number, frequency in self._parse_frequency_statement(
-                                tokens).items():
-                            self._frequency_mapping[
-                                syscall_number] += frequency
-                    elif tokens[0].type == 'DEFAULT':
-                        self._default_action = self._parse_default_statement(
-                            tokens)
-                    elif tokens[0].type == 'DENYLIST':
-                        tokens.pop()
-                        if not self._denylist:
-                            self._parser_state.error('policy is denylist, but '
-                                                     'flag --denylist not '
-                                                     'passed in.')
-                        else:
-                            denylist_header = True
+            for tokens in self._parser_state.tokenize(
+                    self._read_lines(filename)):
+                if tokens[0].type == 'INCLUDE':
+                    statements.extend(
+                        self._parse_include_statement(tokens))
+                elif tokens[0].type == 'FREQUENCY':
+                    for syscall_number, frequency in self._parse_frequency_statement(
+                            tokens).items():
+                        self._frequency_mapping[
+                            syscall_number] += frequency
+                elif tokens[0].type == 'DEFAULT':
+                    self._default_action = self._parse_default_statement(
+                        tokens)
+                elif tokens[0].type == 'DENYLIST':
+                    tokens.pop()
+                    if not self._denylist:
+                        self._parser_state.error('policy is denylist, but '
+                                                 'flag --denylist not '
+                                                 'passed in.')
                     else:
-                        statement = self.parse_filter_statement(tokens)
-                        if statement is None:
-                            # If all the syscalls in the statement are for
-                            # another arch, skip the whole statement.
-                            continue
-                        statements.append(statement)
-
-                    if tokens:
-                        self._parser_state.error(
-                            'extra tokens', token=tokens[0])
+                        denylist_header = True
+                else:
+                    statement = self.parse_filter_statement(tokens)
+                    if statement is None:
+                        # If all the syscalls in the statement are for
+                        # another arch, skip the whole statement.
+                        continue
+                    statements.append(statement)
+
+                if tokens:
+                    self._parser_state.error(
+                        'extra tokens', token=tokens[0])
             if self._denylist and not denylist_header:
                 self._parser_state.error('policy must contain @denylist flag to'
                                          ' be compiled with --denylist flag.')
@@ -772,6 +831,7 @@ class PolicyParser:
     def parse_file(self, filename):
         """Parse a file and return the list of FilterStatements."""
         self._frequency_mapping = collections.defaultdict(int)
+        self._dependencies = []
         try:
             statements = list(self._parse_policy_file(filename))
         except RecursionError:
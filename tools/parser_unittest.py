@@ -20,6 +20,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import hashlib
 import os
 import shutil
 import tempfile
@@ -825,6 +826,81 @@ class ParseFileTests(unittest.TestCase):
                         ]),
                 ]))
 
+    def test_parse_dependencies(self):
+        """Keep track of all the files that were read."""
+        frequency_path = self._write_file(
+            'test.frequency', """
+            read: 2
+        """)
+        include_path = self._write_file(
+            'test.include.policy', """
+            @frequency ./test.frequency
+            write: allow
+        """)
+        path = self._write_file(
+            'test.policy', """
+            @include ./test.include.policy
+            read: allow
+        """)
+
+        self.parser.parse_file(path)
+        self.assertEqual([
+            filename for filename, _ in self.parser.dependency_digests
+        ], [path, include_path, frequency_path])
+        for filename, digest in self.parser.dependency_digests:
+            with open(filename, 'rb') as input_file:
+                self.assertEqual(
+                    digest,
+                    hashlib.sha256(input_file.read()).hexdigest())
+
+    def test_parse_file_cache(self):
+        """Reuse cached file contents across parsers."""
+        file_cache = parser.FileCache()
+        include_path = self._write_file(
+            'test.include.policy', """
+            write: allow
+        """)
+        path = self._write_file(
+            'test.policy', """
+            @include ./test.include.policy
+            read: allow
+        """)
+
+        parsed_policies = [
+            parser.PolicyParser(
+                self.arch, kill_action=bpf.KillProcess(),
+                file_cache=file_cache).parse_file(path) for _ in range(2)
+        ]
+        self.assertEqual(parsed_policies[0], self.parser.parse_file(path))
+        self.assertEqual(parsed_policies[0], parsed_policies[1])
+        self.assertIs(
+            file_cache.read_file(include_path),
+            file_cache.read_file(include_path))
+
+        # Files that change are read again.
+        self._write_file('test.include.policy', """
+            write: kill
+        """)
+        self.assertEqual(
+            parser.PolicyParser(
+                self.arch, kill_action=bpf.KillProcess(),
+                file_cache=file_cache).parse_file(path),
+            self.parser.parse_file(path))
+        self.assertNotEqual(self.parser.parse_file(path), parsed_policies[0])
+
+    def test_file_cache_eviction(self):
+        """Evict the least-recently-used files."""
+        file_cache = parser.FileCache(max_entries=1)
+        first_path = self._write_file('first.policy', 'read: allow\n')
+        second_path = self._write_file('second.policy', 'write: allow\n')
+
+        first_contents = file_cache.read_file(first_path)
+        self.assertIs(file_cache.read_file(first_path), first_contents)
+        self.assertEqual(file_cache.read_file(second_path)[1],
+                         ['write: allow\n'])
+        self.assertIsNot(file_cache.read_file(first_path), first_contents)
+        self.assertEqual(file_cache.read_file(first_path), first_contents)
+
     def test_parse_invalid_frequency(self):
         """Reject including invalid frequency files."""
         path = self._write_file('test.policy',